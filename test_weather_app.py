@@ -1,36 +1,84 @@
+import json
+import os
+import sqlite3
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
-from weather_forecast_app import WeatherData, DatabaseManager
+from weather_forecast_app import WeatherData, DatabaseManager, WeatherApp
+
+LAHORE_PAYLOAD = {
+    "cod": 200,
+    "name": "Lahore",
+    "main": {"temp": 30, "humidity": 50},
+    "wind": {"speed": 2},
+    "weather": [{"description": "clear sky"}],
+    "coord": {"lat": 31.5, "lon": 74.3}
+}
+
+def _response(payload):
+    """Build a mocked HTTP response carrying payload as its JSON body"""
+    response = MagicMock()
+    response.content = json.dumps(payload).encode()
+    return response
 
 class TestWeatherData(unittest.TestCase):
     def setUp(self):
         self.api_key = "dummy_key"
         self.weather = WeatherData(self.api_key)
 
-    @patch('weather_forecast_app.requests.get')
+    @patch('weather_forecast_app.requests.Session.get')
     def test_fetch_weather_success(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.json.return_value = {
-            "cod": 200,
-            "name": "Lahore",
-            "main": {"temp": 30, "humidity": 50},
-            "wind": {"speed": 2},
-            "weather": [{"description": "clear sky"}],
-            "coord": {"lat": 31.5, "lon": 74.3}
-        }
-        mock_response.raise_for_status = MagicMock()
-        mock_get.return_value = mock_response
+        mock_get.return_value = _response(LAHORE_PAYLOAD)
         data, error = self.weather.fetch_weather(city="Lahore")
         self.assertIsNone(error)
         self.assertEqual(data["city"], "Lahore")
         self.assertEqual(data["temp"], 30)
+        self.assertEqual(mock_get.call_args.kwargs["params"]["q"], "Lahore")
+
+    @patch('weather_forecast_app.requests.Session.get')
+    def test_fetch_weather_uses_cache(self, mock_get):
+        mock_get.return_value = _response(LAHORE_PAYLOAD)
+        first, _ = self.weather.fetch_weather(city="Lahore")
+        second, error = self.weather.fetch_weather(city=" lahore ")
+        self.assertIsNone(error)
+        self.assertFalse(first["cached"])
+        self.assertTrue(second["cached"])
+        self.assertEqual(first["timestamp"], second["timestamp"])
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('weather_forecast_app.requests.Session.get')
+    def test_cached_fetch_is_not_saved_to_history_again(self, mock_get):
+        mock_get.return_value = _response(LAHORE_PAYLOAD)
+        app = WeatherApp.__new__(WeatherApp)  # history logic only, no Tk window
+        app.db = DatabaseManager(":memory:")
+        try:
+            for _ in range(2):
+                data, error = self.weather.fetch_weather(city="Lahore")
+                app._save_history(data)
+            self.assertEqual(len(app.db.get_weather_history("Lahore")), 1)
+        finally:
+            app.db.close()
 
-    @patch('weather_forecast_app.requests.get')
+    @patch('weather_forecast_app.requests.Session.get')
+    def test_fetch_many_preserves_order(self, mock_get):
+        names = {31.5: "Lahore", 24.9: "Karachi", 30.2: "Quetta"}
+        def fake_get(url, params=None, timeout=None):
+            return _response({**LAHORE_PAYLOAD, "name": names[params["lat"]]})
+        mock_get.side_effect = fake_get
+        results = self.weather.fetch_many([(31.5, 74.3), (24.9, 67.0), (30.2, 67.0)])
+        self.assertEqual([data["city"] for data, error in results], ["Lahore", "Karachi", "Quetta"])
+
+    @patch('weather_forecast_app.requests.Session.get')
+    def test_fetch_many_can_bypass_cache(self, mock_get):
+        mock_get.return_value = _response(LAHORE_PAYLOAD)
+        self.weather.fetch_many([(31.5, 74.3)])
+        [(data, error)] = self.weather.fetch_many([(31.5, 74.3)], use_cache=False)
+        self.assertFalse(data["cached"])
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('weather_forecast_app.requests.Session.get')
     def test_fetch_weather_error(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.json.return_value = {"cod": 404, "message": "city not found"}
-        mock_response.raise_for_status = MagicMock()
-        mock_get.return_value = mock_response
+        mock_get.return_value = _response({"cod": 404, "message": "city not found"})
         data, error = self.weather.fetch_weather(city="FakeCity")
         self.assertIsNone(data)
         self.assertIn("city not found", error)
@@ -48,11 +96,39 @@ class TestDatabaseManager(unittest.TestCase):
         favs = self.db.get_favorites()
         self.assertEqual(len(favs), 1)
         self.assertEqual(favs[0][0], "Lahore")
+        self.assertEqual(favs[0]["city"], "Lahore")
         success, msg = self.db.remove_favorite("Lahore")
         self.assertTrue(success)
         favs = self.db.get_favorites()
         self.assertEqual(len(favs), 0)
 
+    def test_favorites_are_case_insensitive(self):
+        self.db.add_favorite("Lahore", 31.5, 74.3)
+        success, msg = self.db.add_favorite("lahore", 31.5, 74.3)
+        self.assertFalse(success)
+        success, msg = self.db.remove_favorite("LAHORE")
+        self.assertTrue(success)
+
+    def test_legacy_favorites_table_becomes_case_insensitive(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "legacy.db")
+            conn = sqlite3.connect(path)
+            conn.execute(
+                "CREATE TABLE favorites (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "city TEXT NOT NULL UNIQUE, lat REAL, lon REAL)"
+            )
+            conn.executemany(
+                "INSERT INTO favorites (city, lat, lon) VALUES (?, ?, ?)",
+                [("Lahore", 31.5, 74.3), ("LAHORE", 31.5, 74.3)]
+            )
+            conn.commit()
+            conn.close()
+            db = DatabaseManager(path)
+            self.assertEqual([row["city"] for row in db.get_favorites()], ["Lahore"])
+            success, msg = db.add_favorite("lahore", 31.5, 74.3)
+            self.assertFalse(success)
+            db.close()
+
     def test_save_and_get_weather_history(self):
         weather_data = {
             "city": "Lahore",
@@ -68,5 +144,52 @@ class TestDatabaseManager(unittest.TestCase):
         self.assertEqual(history[0][0], 30)
         self.assertEqual(history[0][1], 50)
 
+    def test_weather_history_is_sorted_by_timestamp(self):
+        for timestamp, temp in (("2025-06-13 18:00:00", 28), ("2025-06-13 12:00:00", 30)):
+            self.db.save_weather_history({
+                "city": "Lahore",
+                "temp": temp,
+                "humidity": 50,
+                "wind_speed": 2,
+                "description": "clear sky",
+                "timestamp": timestamp
+            })
+        history = self.db.get_weather_history("Lahore")
+        self.assertEqual([row[4] for row in history], ["2025-06-13 12:00:00", "2025-06-13 18:00:00"])
+
+    def test_close_flushes_and_is_idempotent(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.db")
+            db = DatabaseManager(path)
+            db.save_weather_history({
+                "city": "Lahore",
+                "temp": 30,
+                "humidity": 50,
+                "wind_speed": 2,
+                "description": "clear sky",
+                "timestamp": "2025-06-13 12:00:00"
+            })
+            db.close()
+            db.close()
+            db = DatabaseManager(path)
+            self.assertEqual(len(db.get_weather_history("Lahore")), 1)
+            db.close()
+
+    def test_weather_history_is_buffered_until_flush(self):
+        weather_data = {
+            "city": "Lahore",
+            "temp": 30,
+            "humidity": 50,
+            "wind_speed": 2,
+            "description": "clear sky",
+            "timestamp": "2025-06-13 12:00:00"
+        }
+        self.db.save_weather_history(weather_data)
+        count = self.db.conn.execute("SELECT COUNT(*) FROM weather_history").fetchone()[0]
+        self.assertEqual(count, 0)
+        self.db.flush_history()
+        count = self.db.conn.execute("SELECT COUNT(*) FROM weather_history").fetchone()[0]
+        self.assertEqual(count, 1)
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,31 +1,98 @@
+import atexit
 import tkinter as tk
 from tkinter import messagebox, ttk
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    from json import loads as json_loads
+
+# SQL for the hot queries, kept as module constants so the connection's
+# statement cache reuses the same prepared statements on every call
+INSERT_FAVORITE_SQL = "INSERT INTO favorites (city, lat, lon) VALUES (?, ?, ?)"
+DELETE_FAVORITE_SQL = "DELETE FROM favorites WHERE city = ? COLLATE NOCASE"
+SELECT_FAVORITES_SQL = "SELECT city, lat, lon FROM favorites"
+INSERT_HISTORY_SQL = (
+    "INSERT INTO weather_history (city, temp, humidity, wind_speed, description, timestamp) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+SELECT_HISTORY_SQL = (
+    "SELECT temp, humidity, wind_speed, description, timestamp FROM weather_history "
+    "WHERE city = ? ORDER BY timestamp"
+)
+
 class WeatherData:
     """Class to handle weather data fetching and processing"""
     def __init__(self, api_key):
         self.api_key = api_key
-        self.base_url = "https://api.openweathermap.org/data/2.5/weather"  
-
-        
-    def fetch_weather(self, city=None, lat=None, lon=None):
-        """Fetch weather data from OpenWeatherMap API"""
+        self.base_url = "https://api.openweathermap.org/data/2.5/weather"
+        self._default_params = {"appid": api_key, "units": "metric"}
+        self._cache: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self._ttl = 300.0  # seconds a cached response stays fresh
+        self._cache_size = 128
+        self._cache_lock = threading.Lock()  # fetch_weather runs on worker threads
+        self._pool = ThreadPoolExecutor(max_workers=8)  # shared by fetch_many calls
+        self.session = requests.Session()
+        retries = Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries))
+
+    def fetch_weather(self, city=None, lat=None, lon=None, use_cache=True):
+        """Fetch weather data from OpenWeatherMap API, using a short-lived cache.
+
+        The returned dict's "cached" key tells callers whether it is a repeat
+        of an earlier fetch rather than a new observation. use_cache=False
+        always asks the API and refreshes the cached entry.
+        """
+        key = (city.strip().casefold() if city else None, lat, lon)
+        if use_cache:
+            with self._cache_lock:
+                cached = self._cache.get(key)
+                if cached and time.monotonic() - cached[0] < self._ttl:
+                    self._cache.move_to_end(key)
+                    return {**cached[1], "cached": True}, None
+
+        weather, error = self._request_weather(city, lat, lon)
+        if weather is not None:
+            with self._cache_lock:
+                self._cache[key] = (time.monotonic(), weather)
+                self._cache.move_to_end(key)
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+            weather = {**weather, "cached": False}
+        return weather, error
+
+    def fetch_many(self, locations: list[tuple[float, float]], use_cache=True) -> list[tuple[dict | None, str | None]]:
+        """Fetch weather for several (lat, lon) pairs in parallel, preserving input order"""
+        return list(self._pool.map(
+            lambda location: self.fetch_weather(lat=location[0], lon=location[1], use_cache=use_cache),
+            locations
+        ))
+
+    def _request_weather(self, city, lat, lon):
+        """Request weather data from the API without consulting the cache"""
         try:
             if city:
-                url = f"{self.base_url}?q={city}&appid={self.api_key}&units=metric"
-            elif lat and lon:
-                url = f"{self.base_url}?lat={lat}&lon={lon}&appid={self.api_key}&units=metric"
+                params = {**self._default_params, "q": city}
+            elif lat is not None and lon is not None:
+                params = {**self._default_params, "lat": lat, "lon": lon}
             else:
                 return None, "Please provide a city name or coordinates."
-            
-            response = requests.get(url)
+
+            response = self.session.get(self.base_url, params=params, timeout=(3.05, 10))
             response.raise_for_status()  # Raises an exception for HTTP errors (e.g., 401)
-            data = response.json()
+            data = json_loads(response.content)
             
             if data.get("cod") != 200:
                 return None, data.get("message", "Error fetching weather data.")
@@ -44,25 +111,54 @@ class WeatherData:
             return None, f"Network error: {str(e)}"
         except KeyError as e:
             return None, f"Data parsing error: Missing key {str(e)}"
+        except ValueError as e:
+            return None, f"Data parsing error: {str(e)}"
 
 class DatabaseManager:
     """Class to handle SQLite database operations"""
     def __init__(self, db_name="weather_app.db"):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
+        self.conn = sqlite3.connect(db_name, cached_statements=256)
+        self.conn.row_factory = sqlite3.Row
+        if db_name != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "PRAGMA synchronous=NORMAL;"
+            "PRAGMA cache_size=-65536;"  # 64 MB page cache
+            "PRAGMA temp_store=MEMORY;"
+            "PRAGMA mmap_size=268435456;"
+        )
         self.create_tables()
+        self._history_buffer: list[tuple] = []
+        self._buffer_limit = 32
+        self._closed = False
 
     def create_tables(self):
         """Create tables for favorite locations and weather history"""
-        self.cursor.execute("""
+        self.conn.execute("""
             CREATE TABLE IF NOT EXISTS favorites (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                city TEXT NOT NULL UNIQUE,
+                city TEXT NOT NULL UNIQUE COLLATE NOCASE,
                 lat REAL,
                 lon REAL
             )
         """)
-        self.cursor.execute("""
+        # One-time migration: tables created before city was declared NOCASE
+        # keep binary uniqueness, so drop case-only duplicates (keeping the
+        # oldest) and enforce NOCASE with an index. NOCASE only folds ASCII,
+        # unlike the str.casefold() cache key, so "Zürich" and "ZÜRICH" share
+        # a cache entry but can still be two favorites.
+        has_index = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_favorites_city_nocase'"
+        ).fetchone()
+        if not has_index:
+            self.conn.execute(
+                "DELETE FROM favorites WHERE id NOT IN "
+                "(SELECT MIN(id) FROM favorites GROUP BY city COLLATE NOCASE)"
+            )
+            self.conn.execute(
+                "CREATE UNIQUE INDEX idx_favorites_city_nocase ON favorites(city COLLATE NOCASE)"
+            )
+        self.conn.execute("""
             CREATE TABLE IF NOT EXISTS weather_history (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 city TEXT,
@@ -73,15 +169,15 @@ class DatabaseManager:
                 timestamp TEXT
             )
         """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_history_city_ts ON weather_history(city, timestamp)"
+        )
         self.conn.commit()
 
     def add_favorite(self, city, lat, lon):
         """Add a city to favorites"""
         try:
-            self.cursor.execute(
-                "INSERT INTO favorites (city, lat, lon) VALUES (?, ?, ?)",
-                (city, lat, lon)
-            )
+            self.conn.execute(INSERT_FAVORITE_SQL, (city, lat, lon))
             self.conn.commit()
             return True, "City added to favorites."
         except sqlite3.IntegrityError:
@@ -89,41 +185,46 @@ class DatabaseManager:
 
     def remove_favorite(self, city):
         """Remove a city from favorites"""
-        self.cursor.execute("DELETE FROM favorites WHERE city = ?", (city,))
+        cursor = self.conn.execute(DELETE_FAVORITE_SQL, (city,))
         self.conn.commit()
-        return self.cursor.rowcount > 0, "City removed." if self.cursor.rowcount > 0 else "City not found."
+        return cursor.rowcount > 0, "City removed." if cursor.rowcount > 0 else "City not found."
 
     def get_favorites(self):
         """Retrieve all favorite cities"""
-        self.cursor.execute("SELECT city, lat, lon FROM favorites")
-        return self.cursor.fetchall()
+        return self.conn.execute(SELECT_FAVORITES_SQL).fetchall()
 
     def save_weather_history(self, weather_data):
-        """Save weather data to history"""
-        self.cursor.execute(
-            "INSERT INTO weather_history (city, temp, humidity, wind_speed, description, timestamp) "
-            "VALUES (?, ?, ?, ?, ?, ?)",
-            (
-                weather_data["city"],
-                weather_data["temp"],
-                weather_data["humidity"],
-                weather_data["wind_speed"],
-                weather_data["description"],
-                weather_data["timestamp"]
-            )
-        )
-        self.conn.commit()
+        """Queue weather data for history, flushing once the buffer is full"""
+        self._history_buffer.append((
+            weather_data["city"],
+            weather_data["temp"],
+            weather_data["humidity"],
+            weather_data["wind_speed"],
+            weather_data["description"],
+            weather_data["timestamp"]
+        ))
+        if len(self._history_buffer) >= self._buffer_limit:
+            self.flush_history()
+
+    def flush_history(self):
+        """Write all buffered history rows in a single transaction"""
+        if not self._history_buffer:
+            return
+        with self.conn:
+            self.conn.executemany(INSERT_HISTORY_SQL, self._history_buffer)
+        self._history_buffer.clear()
 
     def get_weather_history(self, city):
         """Retrieve weather history for a city"""
-        self.cursor.execute(
-            "SELECT temp, humidity, wind_speed, description, timestamp FROM weather_history WHERE city = ?",
-            (city,)
-        )
-        return self.cursor.fetchall()
+        self.flush_history()
+        return self.conn.execute(SELECT_HISTORY_SQL, (city,)).fetchall()
 
     def close(self):
-        """Close database connection"""
+        """Flush pending history and close database connection; safe to call twice"""
+        if self._closed:
+            return
+        self._closed = True
+        self.flush_history()
         self.conn.close()
 
 class WeatherApp:
@@ -134,7 +235,13 @@ class WeatherApp:
         self.root.geometry("800x600")
         self.weather_data = WeatherData("cb2d71f2983036746e39acc3dafa4bd3")  # Your API key
         self.db = DatabaseManager()
+        atexit.register(self.db.close)  # flush history even if mainloop exits without _on_close
+        self._last_weather: dict | None = None  # result of the latest successful search
+        self._favorites: list[sqlite3.Row] = []  # rows shown in the favorites listbox
+        self._executor = ThreadPoolExecutor(max_workers=4)  # keeps network I/O off the Tk thread
+        self._latest_futures = {}  # slot -> newest future submitted for it
         self.setup_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
 
     def setup_gui(self):
         """Set up the Tkinter GUI"""
@@ -157,6 +264,7 @@ class WeatherApp:
 
         # Favorites section
         ttk.Label(self.main_frame, text="Favorite Cities:").grid(row=2, column=0, sticky=tk.W)
+        ttk.Button(self.main_frame, text="Refresh Favorites", command=self.refresh_favorites).grid(row=2, column=2, padx=5)
         self.favorites_listbox = tk.Listbox(self.main_frame, width=30, height=5)
         self.favorites_listbox.grid(row=3, column=0, columnspan=2, pady=5)
         self.favorites_listbox.bind("<<ListboxSelect>>", self.show_favorite_weather)  # Event handling for listbox selection
@@ -167,6 +275,10 @@ class WeatherApp:
         # Graph canvas
         self.canvas_frame = ttk.Frame(self.main_frame)
         self.canvas_frame.grid(row=4, column=0, columnspan=4, pady=10)
+        self.fig = Figure(figsize=(6, 4))
+        self.ax = self.fig.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.canvas_frame)
+        self.canvas.get_tk_widget().pack()
 
         self.update_favorites_list()
 
@@ -177,13 +289,46 @@ class WeatherApp:
             messagebox.showerror("Error", "Please enter a city name.")
             return
 
-        weather, error = self.weather_data.fetch_weather(city=city)
+        self._run_in_background(self.weather_data.fetch_weather, self._on_search_result, city=city, slot="display")
+
+    def _on_search_result(self, result):
+        """Show a finished search on the main thread"""
+        weather, error = result
         if error:
             messagebox.showerror("Error", error)
             return
 
         self.display_weather(weather)
-        self.db.save_weather_history(weather)
+        self._save_history(weather)
+        self._last_weather = weather
+
+    def _run_in_background(self, func, callback, *args, slot=None, **kwargs):
+        """Run func on the worker pool and pass its result to callback on the Tk thread.
+
+        Tasks sharing a slot supersede each other: only the newest one is
+        delivered, so a slow older fetch cannot overwrite a newer result.
+        Tasks without a slot are always delivered.
+        """
+        future = self._executor.submit(func, *args, **kwargs)
+        if slot is not None:
+            self._latest_futures[slot] = future
+        self.root.after(50, self._poll_future, future, callback, slot)
+
+    def _poll_future(self, future, callback, slot):
+        """Re-check a background task until it completes"""
+        if slot is not None and self._latest_futures.get(slot) is not future:
+            return  # superseded by a newer task in the same slot
+        if not future.done():
+            self.root.after(50, self._poll_future, future, callback, slot)
+            return
+        if slot is not None:
+            del self._latest_futures[slot]
+        callback(future.result())
+
+    def _save_history(self, weather):
+        """Record a fetch in history unless it is a cached repeat already recorded"""
+        if not weather["cached"]:
+            self.db.save_weather_history(weather)
 
     def search_weather_event(self, event):
         """Handle Enter key press for search"""
@@ -208,7 +353,15 @@ class WeatherApp:
             messagebox.showerror("Error", "Please enter a city name.")
             return
 
-        weather, error = self.weather_data.fetch_weather(city=city)
+        weather = self._last_weather
+        if weather and weather["city"].casefold() == city.casefold():
+            self._on_favorite_result((weather, None))
+        else:
+            self._run_in_background(self.weather_data.fetch_weather, self._on_favorite_result, city=city)
+
+    def _on_favorite_result(self, result):
+        """Store a fetched city as a favorite on the main thread"""
+        weather, error = result
         if error:
             messagebox.showerror("Error", error)
             return
@@ -225,7 +378,7 @@ class WeatherApp:
             messagebox.showerror("Error", "Please select a city to remove.")
             return
 
-        city = self.favorites_listbox.get(selection[0]).split(" (")[0]
+        city, lat, lon = self._favorites[selection[0]]
         success, message = self.db.remove_favorite(city)
         messagebox.showinfo("Result", message)
         if success:
@@ -233,24 +386,67 @@ class WeatherApp:
 
     def update_favorites_list(self):
         """Update the favorites listbox"""
+        self._favorites = list(self.db.get_favorites())
         self.favorites_listbox.delete(0, tk.END)
-        for city, lat, lon in self.db.get_favorites():
+        for city, lat, lon in self._favorites:
             self.favorites_listbox.insert(tk.END, f"{city} ({lat}, {lon})")
 
+    def refresh_favorites(self):
+        """Fetch weather for every favorite city in the background"""
+        favorites = list(self._favorites)
+        if not favorites:
+            messagebox.showinfo("Info", "No favorite cities to refresh.")
+            return
+
+        self._run_in_background(self._fetch_favorites, self.display_refreshed_favorites, favorites, slot="display")
+
+    def _fetch_favorites(self, favorites):
+        """Fetch fresh weather for several favorites, as _fetch_favorite does for one"""
+        results = self.weather_data.fetch_many([(lat, lon) for city, lat, lon in favorites], use_cache=False)
+        for (city, lat, lon), (weather, error) in zip(favorites, results):
+            if weather is not None:
+                weather["city"] = city
+        return results
+
+    def display_refreshed_favorites(self, results):
+        """Show refreshed favorites weather on the main thread"""
+        lines, errors = [], []
+        for weather, error in results:
+            if error:
+                errors.append(error)
+                continue
+            self._save_history(weather)
+            lines.append(f"{weather['city']}: {weather['temp']}°C, {weather['description']}")
+        if lines:
+            self.weather_label.config(text="\n".join(lines))
+        if errors:
+            messagebox.showerror("Error", "\n".join(errors))
+
     def show_favorite_weather(self, event):
         """Display weather for selected favorite city"""
         selection = self.favorites_listbox.curselection()
         if not selection:
             return
 
-        city = self.favorites_listbox.get(selection[0]).split(" (")[0]
-        weather, error = self.weather_data.fetch_weather(city=city)
+        city, lat, lon = self._favorites[selection[0]]
+        self._run_in_background(self._fetch_favorite, self._on_favorite_weather_result, city, lat, lon, slot="display")
+
+    def _fetch_favorite(self, city, lat, lon):
+        """Fetch a favorite by its stored coordinates and keep its stored name on the result"""
+        weather, error = self.weather_data.fetch_weather(lat=lat, lon=lon)
+        if weather is not None:
+            weather["city"] = city  # history is looked up by the stored favorite name
+        return weather, error
+
+    def _on_favorite_weather_result(self, result):
+        """Show a selected favorite's weather on the main thread"""
+        weather, error = result
         if error:
             messagebox.showerror("Error", error)
             return
 
         self.display_weather(weather)
-        self.db.save_weather_history(weather)
+        self._save_history(weather)
 
     def show_history_graph(self):
         """Display historical weather data in a graph"""
@@ -259,40 +455,37 @@ class WeatherApp:
             messagebox.showerror("Error", "Please select a city to view history.")
             return
 
-        city = self.favorites_listbox.get(selection[0]).split(" (")[0]
+        city, lat, lon = self._favorites[selection[0]]
         history = self.db.get_weather_history(city)
         if not history:
             messagebox.showinfo("Info", f"No weather history for {city}.")
             return
 
         # Prepare data for plotting
-        temps, humidities, timestamps = [], [], []
-        for temp, humidity, wind_speed, desc, timestamp in history:
-            temps.append(temp)
-            humidities.append(humidity)
-            timestamps.append(timestamp)
-
-        # Create plot
-        fig, ax = plt.subplots(figsize=(6, 4))
-        ax.plot(timestamps, temps, label="Temperature (°C)", marker="o")
-        ax.plot(timestamps, humidities, label="Humidity (%)", marker="s")
-        ax.set_title(f"Weather History for {city}")
-        ax.set_xlabel("Timestamp")
-        ax.set_ylabel("Value")
-        ax.legend()
-        ax.tick_params(axis="x", rotation=45)
-
-        # Embed plot in Tkinter
-        for widget in self.canvas_frame.winfo_children():
-            widget.destroy()
-        canvas = FigureCanvasTkAgg(fig, master=self.canvas_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack()
-        plt.close(fig)  
-
-    def __del__(self):
-        """Clean up database connection"""
+        arr = np.array(history, dtype=object)
+        temps = arr[:, 0].astype(np.float32)
+        humidities = arr[:, 1].astype(np.int16)
+        timestamps = np.array([datetime.strptime(t, "%Y-%m-%d %H:%M:%S") for t in arr[:, 4]])
+
+        # Redraw on the shared axes
+        self.ax.clear()
+        self.ax.plot(timestamps, temps, label="Temperature (°C)", marker="o")
+        self.ax.plot(timestamps, humidities, label="Humidity (%)", marker="s")
+        self.ax.set_title(f"Weather History for {city}")
+        self.ax.set_xlabel("Timestamp")
+        self.ax.set_ylabel("Value")
+        self.ax.legend()
+        self.ax.tick_params(axis="x", rotation=45)
+        self.canvas.draw_idle()
+
+    def _on_close(self):
+        """Stop background work, flush history, close the database and destroy the window"""
+        # Queued fetches are cancelled, but one already running cannot be
+        # interrupted: the interpreter joins it on exit, which may take up to
+        # the session timeout times its retries after the window disappears.
+        self._executor.shutdown(wait=False, cancel_futures=True)
         self.db.close()
+        self.root.destroy()
 
 def main():
     root = tk.Tk()